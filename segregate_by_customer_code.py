@@ -13,20 +13,45 @@ Usage examples:
   python3 segregate_by_customer_code.py --input test.xlsx --sheet "Sheet1" --output output.xlsx
 
 Notes:
-- Requires pandas and openpyxl (see requirements.txt)
+- Requires pandas, openpyxl, lxml, python-calamine and xlsxwriter (see requirements.txt);
+  pyarrow for parquet/feather output
 - Sheet names are sanitized to be Excel‑safe and truncated to 31 chars if needed
 """
 from __future__ import annotations
 
 import argparse
+import datetime
 import re
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from io import BytesIO
+from itertools import repeat
 from pathlib import Path
-from typing import Any, Iterable, Set
+from typing import Any, BinaryIO, Iterable, Set
+from xml.sax.saxutils import escape as xml_escape
 
 import pandas as pd
-from openpyxl.utils import column_index_from_string
-from openpyxl import load_workbook, Workbook
-from copy import copy as _copy
+from lxml import etree
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl import load_workbook
+from openpyxl.styles.colors import COLOR_INDEX
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from python_calamine import CalamineWorkbook
+import xlsxwriter
+from xlsxwriter.color import Color
+from xlsxwriter.format import Format
+
+_LETTERS_RE = re.compile(r"[A-Za-z]+")
+_SHEET_TRANS = str.maketrans(dict.fromkeys(":\\/?*[]", "_"))
+_FILE_TRANS = str.maketrans(dict.fromkeys(':\\/?*[]<>|"', "_"))
+_SHEET_PART_RE = re.compile(r"xl/worksheets/sheet(\d+)\.xml")
+
+OUTPUT_FORMATS = ("xlsx", "parquet", "feather")
 
 
 def col_letter_to_index(letter: str) -> int:
@@ -55,7 +80,7 @@ def resolve_key_column(column_spec: str, columns: Iterable[Any]) -> Any:
         return cols[idx]
 
     # Letter(s)
-    if re.fullmatch(r"[A-Za-z]+", s):
+    if _LETTERS_RE.fullmatch(s):
         idx = col_letter_to_index(s)
         if idx < 0 or idx >= len(cols):
             raise ValueError(f"Column letter {s} resolves outside available columns (len={len(cols)})")
@@ -77,164 +102,827 @@ def excel_safe_sheet_name(name: Any, used: Set[str]) -> str:
     """Make a value safe to use as an Excel sheet name and ensure uniqueness.
 
     - Replaces invalid characters : \\ / ? * [ ] with '_'
+    - Strips leading/trailing apostrophes, which Excel rejects
     - Truncates to 31 characters (Excel limit)
-    - Ensures uniqueness by appending _1, _2, ... if needed
+    - Ensures uniqueness (case-insensitive, like Excel) by appending _1, _2, ... if needed
     """
     base = str(name) if pd.notna(name) else "Blank"
     # Replace invalid chars
-    base = re.sub(r"[:\\/\?\*\[\]]", "_", base)
+    base = base.translate(_SHEET_TRANS)
+    base = base.strip("'")
     if not base:
         base = "Sheet"
-    # Truncate to 31
-    base = base[:31]
+    return unique_name(base, used, 31)
 
+
+def safe_file_name(name: Any, used: Set[str]) -> str:
+    """Make a value safe to use as a file name (without extension) and ensure uniqueness.
+
+    - Replaces characters invalid on common filesystems : \\ / ? * [ ] < > | " with '_'
+    - Strips leading/trailing spaces and dots
+    - Truncates to 200 characters, well below filesystem limits
+    - Ensures uniqueness (case-insensitive, for case-insensitive filesystems)
+    """
+    base = str(name) if pd.notna(name) else "Blank"
+    base = base.translate(_FILE_TRANS).strip(" .")
+    if not base:
+        base = "Blank"
+    return unique_name(base, used, 200)
+
+
+def unique_name(base: str, used: Set[str], max_len: int) -> str:
+    """Truncate base to max_len and append _1, _2, ... until it is not in used (case-insensitive)."""
+    base = base[:max_len]
     candidate = base
     i = 1
-    while candidate in used or candidate == "":
+    while candidate.lower() in used or candidate == "":
         suffix = f"_{i}"
-        candidate = (base[: 31 - len(suffix)] + suffix) if len(base) + len(suffix) > 31 else base + suffix
+        candidate = (base[: max_len - len(suffix)] + suffix) if len(base) + len(suffix) > max_len else base + suffix
         i += 1
-    used.add(candidate)
+    used.add(candidate.lower())
     return candidate
 
 
-def copy_cell_style(src, dst) -> None:
-    """Copy common cell style attributes from src to dst."""
+# openpyxl style names -> xlsxwriter format values
+_UNDERLINES = {"single": 1, "double": 2, "singleAccounting": 33, "doubleAccounting": 34}
+_PATTERNS = {
+    "solid": 1, "mediumGray": 2, "darkGray": 3, "lightGray": 4, "darkHorizontal": 5,
+    "darkVertical": 6, "darkDown": 7, "darkUp": 8, "darkGrid": 9, "darkTrellis": 10,
+    "lightHorizontal": 11, "lightVertical": 12, "lightDown": 13, "lightUp": 14,
+    "lightGrid": 15, "lightTrellis": 16, "gray125": 17, "gray0625": 18,
+}
+_BORDERS = {
+    "thin": 1, "medium": 2, "dashed": 3, "dotted": 4, "thick": 5, "double": 6, "hair": 7,
+    "mediumDashed": 8, "dashDot": 9, "mediumDashDot": 10, "dashDotDot": 11,
+    "mediumDashDotDot": 12, "slantDashDot": 13,
+}
+_H_ALIGN = {
+    "left": "left", "center": "center", "right": "right", "fill": "fill", "justify": "justify",
+    "centerContinuous": "center_across", "distributed": "distributed",
+}
+_V_ALIGN = {"top": "top", "center": "vcenter", "bottom": "bottom", "justify": "vjustify", "distributed": "vdistributed"}
+# Tints of the six shades xlsxwriter offers per theme color (0, 1, 2, then the rest)
+_THEME_TINTS = {
+    0: (0.0, -0.05, -0.15, -0.25, -0.35, -0.5),
+    1: (0.0, 0.5, 0.35, 0.25, 0.15, 0.05),
+    2: (0.0, -0.1, -0.25, -0.5, -0.75, -0.9),
+    None: (0.0, 0.8, 0.6, 0.4, -0.25, -0.5),
+}
+# Formats openpyxl applies to unstyled date/time values
+_DEFAULT_DATE_FORMATS = {
+    datetime.datetime: "yyyy-mm-dd h:mm:ss",
+    datetime.date: "yyyy-mm-dd",
+    datetime.time: "h:mm:ss",
+}
+
+
+def xlsx_color(color) -> str | Color | None:
+    """Translate an openpyxl Color into an xlsxwriter color (None if not representable)."""
+    if color is None:
+        return None
+    if color.type == "rgb" and isinstance(color.rgb, str):
+        return "#" + color.rgb[-6:]
+    if color.type == "indexed" and color.indexed < len(COLOR_INDEX):
+        return "#" + COLOR_INDEX[color.indexed][-6:]
+    if color.type == "theme" and color.theme <= 9:
+        tints = _THEME_TINTS.get(color.theme, _THEME_TINTS[None])
+        shade = min(range(len(tints)), key=lambda i: abs(tints[i] - (color.tint or 0.0)))
+        return Color.theme(color.theme, shade)
+    return None
+
+
+def xlsx_format_props(cell) -> dict[str, Any]:
+    """Translate the style of an openpyxl cell into xlsxwriter format properties."""
+    props: dict[str, Any] = {}
+
+    font = cell.font
+    if font is not None:
+        if font.name:
+            props["font_name"] = font.name
+        if font.sz:
+            props["font_size"] = font.sz
+        if font.b:
+            props["bold"] = True
+        if font.i:
+            props["italic"] = True
+        if font.u:
+            props["underline"] = _UNDERLINES.get(font.u, 1)
+        if font.strike:
+            props["font_strikeout"] = True
+        if font.vertAlign == "superscript":
+            props["font_script"] = 1
+        elif font.vertAlign == "subscript":
+            props["font_script"] = 2
+        color = xlsx_color(font.color)
+        if color is not None:
+            props["font_color"] = color
+
+    # Gradient fills have no patternType and are not copied
+    fill = cell.fill
+    pattern = getattr(fill, "patternType", None)
+    if pattern in _PATTERNS:
+        props["pattern"] = _PATTERNS[pattern]
+        fg = xlsx_color(fill.fgColor)
+        bg = xlsx_color(fill.bgColor)
+        if pattern == "solid":
+            # xlsxwriter takes the cell color of solid fills from bg_color
+            if fg is not None:
+                props["bg_color"] = fg
+        else:
+            if fg is not None:
+                props["fg_color"] = fg
+            if bg is not None:
+                props["bg_color"] = bg
+
+    border = cell.border
+    if border is not None:
+        for side_name in ("left", "right", "top", "bottom"):
+            side = getattr(border, side_name)
+            if side is not None and side.style in _BORDERS:
+                props[side_name] = _BORDERS[side.style]
+                color = xlsx_color(side.color)
+                if color is not None:
+                    props[f"{side_name}_color"] = color
+
+    alignment = cell.alignment
+    if alignment is not None:
+        if alignment.horizontal in _H_ALIGN:
+            props["align"] = _H_ALIGN[alignment.horizontal]
+        if alignment.vertical in _V_ALIGN:
+            props["valign"] = _V_ALIGN[alignment.vertical]
+        if alignment.wrap_text:
+            props["text_wrap"] = True
+        if alignment.shrink_to_fit:
+            props["shrink"] = True
+        if alignment.indent:
+            props["indent"] = int(alignment.indent)
+        rotation = alignment.text_rotation
+        if rotation:
+            # Excel stores -1..-90 as 91..180 and vertical text as 255
+            props["rotation"] = 270 if rotation == 255 else rotation if rotation <= 90 else 90 - rotation
+
+    protection = cell.protection
+    if protection is not None:
+        if protection.locked is False:
+            props["locked"] = False
+        if protection.hidden:
+            props["hidden"] = True
+
+    number_format = cell.number_format
+    if number_format and number_format != "General":
+        props["num_format"] = number_format
+
+    return props
+
+
+def read_sheet_rows(ws, max_row: int | None = None) -> tuple[list[tuple[Any, ...]], list[tuple[int, ...]], dict[int, Any]]:
+    """Read the rows of a read-only worksheet (all, or up to max_row) in a single pass.
+
+    Rows are taken whole from iter_rows() and split into column-aligned buffers
+    indexed by ``row - 1``: the cell values, the style id of each cell, and one
+    sample cell per style id to copy styles from. When reading to the end,
+    trailing rows without values (formatting only) are dropped.
+    """
+    values: list[tuple[Any, ...]] = []
+    style_ids: list[tuple[int, ...]] = []
+    style_cells: dict[int, Any] = {}
+    if max_row == 0:
+        return values, style_ids, style_cells
+    # Rows mostly repeat a handful of style patterns; share one tuple per pattern
+    patterns: dict[tuple[int, ...], tuple[int, ...]] = {}
+    last = 0
+    for row in ws.iter_rows(max_row=max_row):
+        row_values = tuple([cell.value for cell in row])
+        values.append(row_values)
+        if row_values.count(None) != len(row_values):
+            last = len(values)
+        # Empty cells are a shared EmptyCell placeholder without a style id
+        row_ids = tuple([getattr(cell, "_style_id", 0) for cell in row])
+        pattern = patterns.get(row_ids)
+        if pattern is None:
+            for cell, sid in zip(row, row_ids):
+                if sid and sid not in style_cells:
+                    style_cells[sid] = cell
+            pattern = patterns[row_ids] = row_ids
+        style_ids.append(pattern)
+    if max_row is None:
+        del values[last:], style_ids[last:]
+    return values, style_ids, style_cells
+
+
+def read_sheet_values(input_path: Path | BinaryIO, sheet_name: str) -> list[tuple[Any, ...]]:
+    """Read all cell values of the named sheet with python-calamine.
+
+    Take the name from the worksheet openpyxl selected: calamine's sheet
+    indices also count chartsheets.
+
+    Much faster than openpyxl but values only (formulas come back as their
+    cached results; error results such as #DIV/0! or #N/A come back as empty
+    cells, since calamine reports them as ""). Values are normalized to what openpyxl would return:
+    empty cells become None, whole-number floats become int and equal strings
+    are the same object. Trailing empty rows are dropped.
+    """
+    if isinstance(input_path, Path):
+        wb = CalamineWorkbook.from_path(str(input_path))
+    else:
+        input_path.seek(0)
+        wb = CalamineWorkbook.from_filelike(input_path)
     try:
-        if getattr(src, "has_style", False):
-            if src.font is not None:
-                dst.font = _copy(src.font)
-            if src.fill is not None:
-                dst.fill = _copy(src.fill)
-            if src.border is not None:
-                dst.border = _copy(src.border)
-            if src.alignment is not None:
-                dst.alignment = _copy(src.alignment)
-            if src.protection is not None:
-                dst.protection = _copy(src.protection)
-            # number_format is a string
-            dst.number_format = src.number_format
-    except TypeError:
-        # Fallback: ignore style copy if objects are not hashable in this environment
-        dst.number_format = src.number_format
-
-
-def copy_header_and_layout(ws_src, ws_dst, header_rows: int) -> None:
-    """Copy the top header_rows (values + styles), merges, widths, row heights and freeze panes."""
-    max_col = ws_src.max_column
-
-    # Copy column widths
-    for key, dim in ws_src.column_dimensions.items():
-        ws_dst.column_dimensions[key].width = dim.width
-
-    # Copy header cells and row heights
-    for r in range(1, header_rows + 1):
-        if ws_src.row_dimensions[r].height is not None:
-            ws_dst.row_dimensions[r].height = ws_src.row_dimensions[r].height
-        for c in range(1, max_col + 1):
-            s = ws_src.cell(row=r, column=c)
-            d = ws_dst.cell(row=r, column=c, value=s.value)
-            copy_cell_style(s, d)
-
-    # Copy merged cells that intersect headers
-    for rng in ws_src.merged_cells.ranges:
+        rows = wb.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+    finally:
+        wb.close()
+
+    # calamine hands back a new str for every text cell. Share one object per
+    # distinct text, like openpyxl's shared strings table, so repeated codes
+    # and labels are stored once.
+    strings: dict[str, str] = {}
+    values: list[tuple[Any, ...]] = []
+    last = 0
+    for row in rows:
+        row_values = []
+        for v in row:
+            if v == "":
+                v = None
+            elif isinstance(v, str):
+                v = strings.setdefault(v, v)
+            elif isinstance(v, float) and v.is_integer():
+                v = int(v)
+            row_values.append(v)
+        values.append(tuple(row_values))
+        if row_values.count(None) != len(row_values):
+            last = len(values)
+    del values[last:]
+    return values
+
+
+def read_sheet_layout(ws) -> tuple[list[tuple[int, int, float]], dict[int, float], list[str]]:
+    """Read column widths, row heights and merged ranges of a read-only worksheet.
+
+    Read-only worksheets don't expose dimensions or merges, so the sheet XML is
+    scanned for the <col>, <row> and <mergeCell> elements only.
+    Returns ``(column_widths, row_heights, merged_ranges)`` where column widths
+    are ``(min_col, max_col, width)`` spans as stored in the file.
+    """
+    col_tag = f"{{{SHEET_MAIN_NS}}}col"
+    row_tag = f"{{{SHEET_MAIN_NS}}}row"
+    merge_tag = f"{{{SHEET_MAIN_NS}}}mergeCell"
+
+    column_widths: list[tuple[int, int, float]] = []
+    row_heights: dict[int, float] = {}
+    merged_ranges: list[str] = []
+
+    # ReadOnlyWorksheet has no public accessor for its XML part
+    with ws._get_source() as src:
+        events = etree.iterparse(
+            src, tag=(col_tag, row_tag, merge_tag), resolve_entities=False, huge_tree=True
+        )
+        for _, el in events:
+            if el.tag == row_tag:
+                ht = el.get("ht")
+                if ht is not None:
+                    row_heights[int(el.get("r"))] = float(ht)
+                # Drop parsed rows (and their cells) as we go
+                el.clear()
+                while el.getprevious() is not None:
+                    del el.getparent()[0]
+            elif el.tag == col_tag:
+                width = el.get("width")
+                if width is not None:
+                    column_widths.append((int(el.get("min")), int(el.get("max")), float(width)))
+            else:
+                merged_ranges.append(el.get("ref"))
+    return column_widths, row_heights, merged_ranges
+
+
+def collect_format_props(style_cells: dict[int, Any]) -> tuple[list[dict[str, Any]], dict[int, int]]:
+    """Translate the source styles into xlsxwriter format properties, once per run.
+
+    Source style ids that share the same font, fill, border, alignment,
+    protection and number format (e.g. differing only in attributes we don't
+    copy) are interned to a single entry. Returns the distinct property dicts
+    and, for each style id, the index of its entry. Both are plain data, so
+    they can be handed to worker processes.
+    """
+    format_props: list[dict[str, Any]] = []
+    style_formats: dict[int, int] = {}
+    interned: dict[tuple[Any, ...], int] = {}
+    for sid, cell in style_cells.items():
+        key = (cell.font, cell.fill, cell.border, cell.alignment, cell.protection, cell.number_format)
+        idx = interned.get(key)
+        if idx is None:
+            idx = interned[key] = len(format_props)
+            format_props.append(xlsx_format_props(cell))
+        style_formats[sid] = idx
+    return format_props, style_formats
+
+
+def build_formats(wb_out, format_props: list[dict[str, Any]], style_formats: dict[int, int]) -> dict[Any, Format]:
+    """Create the xlsxwriter formats used for every output sheet, once per workbook.
+
+    Returns formats keyed by source style id, plus the default date/time
+    formats for unstyled values keyed by value type.
+    """
+    created = [wb_out.add_format(props) for props in format_props]
+    formats: dict[Any, Format] = {sid: created[idx] for sid, idx in style_formats.items()}
+    for value_type, num_format in _DEFAULT_DATE_FORMATS.items():
+        formats[value_type] = wb_out.add_format({"num_format": num_format})
+    return formats
+
+
+def assign_xf_indices(formats: dict[Any, Format]) -> None:
+    """Number every format up front, in creation order.
+
+    xlsxwriter otherwise numbers formats in order of first use. Workbooks that
+    build the same formats and call this end up with identical styles.xml
+    parts and cell style indices, which merge_sheet_parts() relies on.
+    """
+    for fmt in formats.values():
+        fmt._get_xf_index()
+
+
+def workbook_options(tmpdir: str | None) -> dict[str, Any]:
+    """xlsxwriter options for output workbooks.
+
+    constant_memory flushes each row to a temp file as soon as the next one
+    starts, so memory stays flat however large the sheets are; rows are
+    always written in increasing order here. The temp files live in tmpdir
+    (next to the output) rather than a possibly RAM-backed /tmp, and close()
+    streams them into the zip without building the parts in memory. A tmpdir
+    of None uses the system temp directory.
+    """
+    return {"constant_memory": True, "strings_to_urls": False, "tmpdir": tmpdir}
+
+
+def write_cells(ws_dst, row: int, values: Iterable[Any], style_ids: Iterable[int] | None, formats: dict[Any, Format]) -> None:
+    """Write one row of source values to an xlsxwriter worksheet (0-based row).
+
+    formats maps source style ids to xlsxwriter formats, plus the value types
+    that need a default date/time format when the cell is unstyled. Without
+    style_ids every cell is written as a plain value.
+    """
+    if style_ids is None:
+        style_ids = repeat(0)
+    for c, (v, sid) in enumerate(zip(values, style_ids)):
+        if sid:
+            fmt = formats[sid]
+        elif v is not None:
+            fmt = formats.get(type(v))
+        else:
+            continue
+        if isinstance(v, (ArrayFormula, DataTableFormula)):
+            write_formula_object(ws_dst, row, c, v, fmt)
+        else:
+            ws_dst.write(row, c, v, fmt)
+
+
+def write_formula_object(ws_dst, row: int, col: int, value: ArrayFormula | DataTableFormula, fmt: Format | None) -> None:
+    """Write an array formula or data table cell as read by openpyxl.
+
+    The rows of an output sheet need not be adjacent in the source, so an
+    array formula is written to its anchor cell only, as a single-cell array
+    formula; the other cells of a multi-cell range keep their cached values.
+    xlsxwriter can't write data tables (What-If analysis), so those cells keep
+    their format but are left empty.
+    """
+    if isinstance(value, ArrayFormula):
+        ws_dst.write_array_formula(row, col, row, col, value.text or "", fmt)
+    else:
+        ws_dst.write_blank(row, col, None, fmt)
+
+
+def prepare_header(values, style_ids, layout, header_rows: int) -> tuple[list[tuple[Any, Any, Any]], list[tuple[int, int, int]], list[list[int]]]:
+    """Work out the header block shared by every output sheet, once per run.
+
+    Returns the header rows as ``(values, style_ids, height)`` like the data
+    rows, the column widths as 0-based ``(first_col, last_col, pixels)`` spans
+    and the merged ranges that intersect the header as 0-based
+    ``[first_row, first_col, last_row, last_col]``.
+    """
+    column_widths, row_heights, merged_ranges = layout
+    rows = [
+        (values[r - 1], style_ids[r - 1], row_heights.get(r))
+        for r in range(1, min(header_rows, len(values)) + 1)
+    ]
+    # Stored widths already include Excel's cell padding, so they are set in
+    # pixels (7px per character) to keep them unchanged.
+    columns = [(min_col - 1, max_col - 1, round(width * 7)) for min_col, max_col, width in column_widths]
+    merges = []
+    for ref in merged_ranges:
+        rng = CellRange(ref)
         if rng.min_row <= header_rows:
-            ws_dst.merge_cells(str(rng))
+            merges.append([rng.min_row - 1, rng.min_col - 1, rng.max_row - 1, rng.max_col - 1])
+    return rows, columns, merges
+
+
+def copy_header_and_layout(header, formats, ws_dst, header_rows: int) -> None:
+    """Copy the header rows (values + styles), merges, widths, row heights and freeze panes.
+
+    header comes from prepare_header(). ws_dst is an xlsxwriter worksheet in
+    constant_memory mode, so rows must be written top to bottom and each row
+    height set before the row's cells.
+    """
+    rows, columns, merges = header
+
+    for first_col, last_col, pixels in columns:
+        ws_dst.set_column_pixels(first_col, last_col, pixels)
 
     # Freeze panes below the header
-    ws_dst.freeze_panes = f"A{header_rows + 1}"
+    if header_rows > 0:
+        ws_dst.freeze_panes(header_rows, 0)
+
+    for r, (row_values, row_ids, height) in enumerate(rows):
+        if height is not None:
+            ws_dst.set_row(r, height)
+        write_cells(ws_dst, r, row_values, row_ids, formats)
+
+    # merge_range() would pad the range with blank cells, which constant_memory
+    # mode drops for rows that are already flushed, so the ranges are
+    # registered directly.
+    ws_dst.merge.extend(merges)
+
+
+def write_group_sheet(ws_dst, header, rows: Iterable[tuple[Any, Any, Any]], formats, header_rows: int) -> None:
+    """Write the header block and the data rows of one output sheet.
+
+    rows yields ``(values, style_ids, height)`` per data row; style_ids is None
+    for plain values and height None when the source row has no custom height.
+    """
+    copy_header_and_layout(header, formats, ws_dst, header_rows)
+    for out_r, (row_values, row_ids, height) in enumerate(rows, start=header_rows):
+        if height is not None:
+            ws_dst.set_row(out_r, height)
+        write_cells(ws_dst, out_r, row_values, row_ids, formats)
+
+
+def write_sheet_part(path: str, name: str, header, rows, format_props, style_formats, header_rows: int, selected: bool) -> str:
+    """Write one output sheet into a workbook of its own (runs in a worker process).
+
+    The sheet goes second, after a placeholder: xlsxwriter always selects the
+    first sheet, and only the first sheet of the merged output may carry the
+    selected flag. Returns path.
+    """
+    wb = xlsxwriter.Workbook(path, workbook_options(str(Path(path).parent)))
+    formats = build_formats(wb, format_props, style_formats)
+    assign_xf_indices(formats)
+    wb.add_worksheet(excel_safe_sheet_name("Sheet", {name.lower()}))
+    ws_dst = wb.add_worksheet(name)
+    if selected:
+        ws_dst.activate()
+    write_group_sheet(ws_dst, header, rows, formats, header_rows)
+    wb.close()
+    return path
+
+
+def merge_sheet_parts(skeleton_path: Path, part_paths: list[str], output_path: Path | BinaryIO) -> None:
+    """Assemble the output from a skeleton workbook and one part file per sheet.
+
+    The skeleton holds every sheet (empty) plus the workbook, styles and
+    package parts; each xl/worksheets/sheetN.xml is swapped for the sheet
+    written by the matching worker (the second sheet of its part file).
+    """
+    with zipfile.ZipFile(skeleton_path) as skeleton, zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as out:
+        for info in skeleton.infolist():
+            m = _SHEET_PART_RE.fullmatch(info.filename)
+            if m is None:
+                out.writestr(info, skeleton.read(info))
+                continue
+            with zipfile.ZipFile(part_paths[int(m.group(1)) - 1]) as part:
+                size = part.getinfo("xl/worksheets/sheet2.xml").file_size
+                with part.open("xl/worksheets/sheet2.xml") as src, out.open(
+                    info.filename, "w", force_zip64=size > zipfile.ZIP64_LIMIT
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+
+
+def sheet_name_pattern(name: str) -> re.Pattern[bytes]:
+    """Match a reference to a sheet as it can appear in the XML parts of a package.
+
+    References name the sheet followed by '!' (Data!A1, 'My Data'!A1). Covers
+    quoting ('O''Brien'!A1) and XML escaping, and ignores case like Excel
+    does. Errs on the side of a match (e.g. MyData!A1 matches Data).
+    """
+    variants = set()
+    for text in (name, name.replace("'", "''")):
+        variants.update({text, xml_escape(text), xml_escape(text, {"'": "&apos;", '"': "&quot;"})})
+    alternatives = b"|".join(re.escape(v.encode("utf-8")) for v in sorted(variants, key=len, reverse=True))
+    return re.compile(b"(?:" + alternatives + b")(?:'|&apos;|&#39;)?!", re.IGNORECASE)
+
+
+def part_matches(src: zipfile.ZipFile, name: str, pattern: re.Pattern[bytes], overlap: int) -> bool:
+    """Search one (possibly huge) zip member in chunks."""
+    tail = b""
+    with src.open(name) as part:
+        while chunk := part.read(1 << 20):
+            data = tail + chunk
+            if pattern.search(data):
+                return True
+            tail = data[-overlap:]
+    return False
+
+
+def copy_workbook_renamed(input_path: Path | BinaryIO, output_path: Path | BinaryIO, old_name: str, new_name: str) -> bool:
+    """Copy a single-sheet workbook as-is, renaming its sheet if needed.
+
+    Only xl/workbook.xml and the sheet titles in docProps/app.xml are
+    rewritten; every other part is copied byte for byte. Returns False without
+    writing anything when the rename can't be done safely this way: when
+    formulas, charts, data validations, defined names etc. may refer to the
+    old sheet name (any part under xl/ mentioning it, except the shared
+    strings, styles and theme), when writing to a file object and the
+    workbook is macro-enabled (there is no extension to match, so .xlsx is
+    assumed), or when the output is the input itself, which the copy would
+    truncate while reading it.
+    """
+    if input_path is output_path or (
+        isinstance(input_path, Path) and isinstance(output_path, Path) and input_path.resolve() == output_path.resolve()
+    ):
+        return False
+    if old_name == new_name and isinstance(input_path, Path) and isinstance(output_path, Path):
+        shutil.copyfile(input_path, output_path)
+        return True
+
+    with zipfile.ZipFile(input_path) as src:
+        if not (isinstance(input_path, Path) and isinstance(output_path, Path)) and b"macroEnabled" in src.read("[Content_Types].xml"):
+            return False
+        workbook = etree.fromstring(src.read("xl/workbook.xml"))
+        if old_name != new_name:
+            pattern = sheet_name_pattern(old_name)
+            overlap = len(old_name.encode("utf-8")) * 12
+            for defined_name in workbook.iter(f"{{{SHEET_MAIN_NS}}}definedName"):
+                if pattern.search((defined_name.text or "").encode("utf-8")):
+                    return False
+            for name in src.namelist():
+                if (
+                    name.startswith("xl/")
+                    and name.endswith(".xml")
+                    and name not in ("xl/workbook.xml", "xl/styles.xml", "xl/sharedStrings.xml")
+                    and not name.startswith("xl/theme/")
+                    and part_matches(src, name, pattern, overlap)
+                ):
+                    return False
+        for sheet_el in workbook.iter(f"{{{SHEET_MAIN_NS}}}sheet"):
+            if sheet_el.get("name") == old_name:
+                sheet_el.set("name", new_name)
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as out:
+            for info in src.infolist():
+                if info.filename == "xl/workbook.xml":
+                    out.writestr(info, etree.tostring(workbook, xml_declaration=True, encoding="UTF-8", standalone=True))
+                elif info.filename == "docProps/app.xml":
+                    app = etree.fromstring(src.read(info))
+                    for title in app.iter("{*}lpstr"):
+                        if title.text == old_name:
+                            title.text = new_name
+                    out.writestr(info, etree.tostring(app, xml_declaration=True, encoding="UTF-8", standalone=True))
+                else:
+                    with src.open(info) as part, out.open(info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+                        shutil.copyfileobj(part, dst)
+    return True
+
+
+def data_frame(values, header_rows: int) -> pd.DataFrame:
+    """Build a DataFrame of the data rows, named after the last header row.
+
+    Blank or repeated names fall back to the column letter, suffixed with
+    _1, _2, ... if that is taken too. Header cells past the data columns
+    (e.g. formatting only) are ignored. Columns holding a mix of text and
+    numbers are stored as text, which columnar formats need.
+    """
+    width = max(map(len, values[header_rows:]), default=0)
+    labels = values[header_rows - 1] if header_rows > 0 else ()
+    names: list[str] = []
+    for c in range(width):
+        label = labels[c] if c < len(labels) else None
+        name = str(label).strip() if label is not None else ""
+        if not name or name in names:
+            name = get_column_letter(c + 1)
+        base, i = name, 1
+        while name in names:
+            name = f"{base}_{i}"
+            i += 1
+        names.append(name)
+
+    df = pd.DataFrame.from_records(values[header_rows:], columns=names)
+    for name in names:
+        if pd.api.types.infer_dtype(df[name], skipna=True).startswith("mixed"):
+            df[name] = df[name].map(lambda v: None if v is None else str(v)).astype(object)
+    return df
+
+
+def write_columnar(values, groups: dict[str, list[int]], header_rows: int, output_dir: Path, output_format: str) -> None:
+    """Write each group of data rows to <output_dir>/<code>.<format> (parquet or feather).
+
+    File names are made safe with safe_file_name(). Needs pyarrow.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    df = data_frame(values, header_rows)
+    used_names: Set[str] = set()
+    for code, row_indices in groups.items():
+        part = df.take([r - header_rows - 1 for r in row_indices]).reset_index(drop=True)
+        path = output_dir / f"{safe_file_name(code, used_names)}.{output_format}"
+        if output_format == "parquet":
+            part.to_parquet(path, compression="zstd", index=False)
+        else:
+            part.to_feather(path, compression="zstd")
 
 
 def resolve_key_column_index(ws, column_spec: str, header_rows: int) -> int:
     """Resolve to a 1-based column index on the openpyxl worksheet.
 
     Accepts letter (e.g., 'F'), 1-based index ('6'), or a header label searched
-    within the first `header_rows` rows (case-insensitive).
+    within the first `header_rows` rows (case-insensitive). Works with both
+    regular and read-only worksheets.
     """
     s = str(column_spec).strip()
 
     if s.isdigit():
+        if int(s) < 1:
+            raise ValueError(f"Column index {s} is out of range (must be at least 1)")
         return int(s)
 
-    if re.fullmatch(r"[A-Za-z]+", s):
+    if _LETTERS_RE.fullmatch(s):
         return column_index_from_string(s)
 
     # Search header area for a matching label
     s_lower = s.lower()
-    for r in range(1, header_rows + 1):
-        for c in range(1, ws.max_column + 1):
-            val = ws.cell(row=r, column=c).value
-            if val is not None and str(val).strip().lower() == s_lower:
-                return c
+    if header_rows > 0:
+        for row in ws.iter_rows(min_row=1, max_row=header_rows, values_only=True):
+            for c, val in enumerate(row, start=1):
+                if val is not None and str(val).strip().lower() == s_lower:
+                    return c
 
     raise ValueError(f"Could not resolve column '{column_spec}' in header area")
 
 
+def select_worksheet(wb, sheet: str | int | None):
+    """Return the worksheet chosen by name or 0-based index (default: first sheet)."""
+    if sheet is None:
+        return wb.worksheets[0]
+    if isinstance(sheet, int):
+        return wb.worksheets[sheet]
+    return wb[sheet]
+
+
 def segregate(
-    input_path: Path,
-    output_path: Path | None = None,
+    input_path: Path | BinaryIO,
+    output_path: Path | BinaryIO | None = None,
     sheet: str | int | None = None,
     column_spec: str = "F",
     header_rows: int = 8,
-) -> Path:
-    # Load source workbook and worksheet
-    wb_src = load_workbook(input_path)
-    if sheet is None:
-        ws_src = wb_src.worksheets[0]
-    elif isinstance(sheet, int):
-        ws_src = wb_src.worksheets[sheet]
-    else:
-        ws_src = wb_src[sheet]
-
-    max_row = ws_src.max_row
-    max_col = ws_src.max_column
-    if max_row <= header_rows:
+    values_only: bool = False,
+    jobs: int = 1,
+    output_format: str = "xlsx",
+) -> Path | BinaryIO:
+    """Write one sheet per customer code and return the output path.
+
+    input_path and output_path may also be binary file objects (e.g. BytesIO),
+    in which case output_path is required.
+
+    With values_only=True only the header keeps its formatting; data rows are
+    read with python-calamine and written as plain values, which is much faster
+    on large sheets. With jobs > 1 the output sheets are written in that many
+    worker processes and merged into one workbook.
+
+    With output_format "parquet" or "feather" the data rows are read as values
+    and written to one file per code in the output directory (default
+    <input>_segregated/); the header rows only supply the column names.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'. Choose from: {', '.join(OUTPUT_FORMATS)}")
+    columnar = output_format != "xlsx"
+    if columnar and output_path is not None and not isinstance(output_path, Path):
+        raise ValueError(f"{output_format} output is written to a directory, not a file object.")
+
+    # Read the source once in read-only mode: values and style ids into
+    # row buffers, plus the sheet layout from the worksheet XML. The sheet
+    # XML is decompressed twice, so the (compressed) file is loaded into
+    # memory up front instead of being read back from disk chunk by chunk.
+    source = BytesIO(input_path.read_bytes()) if isinstance(input_path, Path) else input_path
+    wb_src = load_workbook(source, read_only=True)
+    try:
+        ws_src = select_worksheet(wb_src, sheet)
+        key_col = resolve_key_column_index(ws_src, column_spec, header_rows)
+        values, style_ids, style_cells = read_sheet_rows(
+            ws_src, max_row=header_rows if values_only or columnar else None
+        )
+        layout = None if columnar else read_sheet_layout(ws_src)
+        single_sheet = len(wb_src.sheetnames) == 1
+        source_title = ws_src.title
+    finally:
+        wb_src.close()
+
+    if values_only or columnar:
+        values = values + read_sheet_values(input_path, source_title)[len(values):]
+
+    if len(values) <= header_rows:
         raise ValueError("The input sheet has no data rows below the header.")
 
-    key_col = resolve_key_column_index(ws_src, column_spec, header_rows)
-
-    # Prepare output path
-    if output_path is None:
-        output_path = input_path.with_name(f"{input_path.stem}_segregated{input_path.suffix}")
-
     # Collect row indices per code
-    groups: dict[str, list[int]] = {}
+    groups: defaultdict[str, list[int]] = defaultdict(list)
     data_start = header_rows + 1
-    for r in range(data_start, max_row + 1):
-        code_val = ws_src.cell(row=r, column=key_col).value
+    key_idx = key_col - 1
+    for r in range(data_start, len(values) + 1):
+        row = values[r - 1]
+        code_val = row[key_idx] if key_idx < len(row) else None
         if code_val is None or str(code_val).strip() == "":
             continue
         code_key = str(code_val)
-        groups.setdefault(code_key, []).append(r)
+        groups[code_key].append(r)
 
     if not groups:
         raise ValueError("No customer codes found in the specified column.")
 
-    # Write output workbook
-    wb_out = Workbook()
-    # Remove default sheet
-    default_ws = wb_out.active
-    wb_out.remove(default_ws)
+    # Prepare output path
+    if output_path is None:
+        if not isinstance(input_path, Path):
+            raise ValueError("An output path is required when the input is not a file path.")
+        suffix = "" if columnar else input_path.suffix
+        output_path = input_path.with_name(f"{input_path.stem}_segregated{suffix}")
+
+    if columnar:
+        write_columnar(values, groups, header_rows, output_path, output_format)
+        return output_path
 
     used_names: Set[str] = set()
+    sheet_names = [excel_safe_sheet_name(code, used_names) for code in groups]
+
+    # One code covering every data row of a single-sheet workbook: the output
+    # is the input under another sheet name, so copy the file instead of
+    # rebuilding it cell by cell. copy_workbook_renamed() declines when
+    # anything refers to the sheet by name, which falls through to the normal
+    # path.
+    if (
+        single_sheet
+        and not values_only
+        and len(groups) == 1
+        and (
+            not isinstance(output_path, Path)
+            or not isinstance(input_path, Path)
+            or output_path.suffix.lower() == input_path.suffix.lower()
+        )
+        and next(iter(groups.values())) == list(range(data_start, len(values) + 1))
+        and copy_workbook_renamed(input_path, output_path, source_title, sheet_names[0])
+    ):
+        return output_path
+
+    row_heights = layout[1]
+    header = prepare_header(values, style_ids, layout, header_rows)
+    format_props, style_formats = collect_format_props(style_cells)
+    tmpdir = str(output_path.resolve().parent) if isinstance(output_path, Path) else None
+
+    def group_rows(row_indices: list[int]):
+        for r in row_indices:
+            yield values[r - 1], None if values_only else style_ids[r - 1], row_heights.get(r)
+
+    if jobs > 1 and len(groups) > 1:
+        # Each worker writes one sheet into its own file; the sheets are then
+        # spliced into a skeleton workbook that shares their styles.
+        with tempfile.TemporaryDirectory(dir=tmpdir) as work:
+            part_paths = [str(Path(work) / f"part{i}.xlsx") for i in range(len(sheet_names))]
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                # Submit groups as workers free up, so only the rows of the
+                # groups in flight are pickled at any one time.
+                pending: set[Future] = set()
+                for i, (name, row_indices) in enumerate(zip(sheet_names, groups.values())):
+                    if len(pending) >= 2 * jobs:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    pending.add(
+                        pool.submit(
+                            write_sheet_part,
+                            part_paths[i],
+                            name,
+                            header,
+                            list(group_rows(row_indices)),
+                            format_props,
+                            style_formats,
+                            header_rows,
+                            i == 0,
+                        )
+                    )
+                for future in pending:
+                    future.result()
+
+            skeleton_path = Path(work) / "skeleton.xlsx"
+            wb_out = xlsxwriter.Workbook(str(skeleton_path), workbook_options(work))
+            assign_xf_indices(build_formats(wb_out, format_props, style_formats))
+            for name in sheet_names:
+                wb_out.add_worksheet(name)
+            wb_out.close()
+            merge_sheet_parts(skeleton_path, part_paths, output_path)
+        return output_path
 
-    for code, row_indices in groups.items():
-        ws_dst = wb_out.create_sheet(title=excel_safe_sheet_name(code, used_names))
-        # Copy header + layout
-        copy_header_and_layout(ws_src, ws_dst, header_rows)
+    # Write output workbook
+    wb_out = xlsxwriter.Workbook(str(output_path) if isinstance(output_path, Path) else output_path, workbook_options(tmpdir))
+    formats = build_formats(wb_out, format_props, style_formats)
+    # Same style numbering as the --jobs path, so both write the same file
+    assign_xf_indices(formats)
 
-        out_r = data_start
-        for r in row_indices:
-            # Copy row height if present
-            if ws_src.row_dimensions[r].height is not None:
-                ws_dst.row_dimensions[out_r].height = ws_src.row_dimensions[r].height
-            for c in range(1, max_col + 1):
-                s = ws_src.cell(row=r, column=c)
-                d = ws_dst.cell(row=out_r, column=c, value=s.value)
-                copy_cell_style(s, d)
-            out_r += 1
-
-    wb_out.save(output_path)
+    for name, row_indices in zip(sheet_names, groups.values()):
+        ws_dst = wb_out.add_worksheet(name)
+        write_group_sheet(ws_dst, header, group_rows(row_indices), formats, header_rows)
+
+    wb_out.close()
     return output_path
 
 
@@ -243,8 +931,11 @@ def main() -> None:
     parser.add_argument("--input", "-i", type=Path, default=Path("test.xlsx"), help="Path to the source .xlsx file (default: ./test.xlsx)")
     parser.add_argument("--sheet", "-s", help="Sheet name or 0-based index to read (default: first sheet)")
     parser.add_argument("--column", "-c", default="F", help="Customer code column (letter like F, 1-based index, or header name). Default: F")
-    parser.add_argument("--output", "-o", type=Path, help="Output .xlsx path (default: <input>_segregated.xlsx)")
+    parser.add_argument("--output", "-o", type=Path, help="Output .xlsx path, or the output directory with --format parquet/feather (default: <input>_segregated.xlsx or <input>_segregated/)")
     parser.add_argument("--header-rows", type=int, default=8, help="Number of header rows at the top to copy verbatim. Default: 8")
+    parser.add_argument("--values-only", action="store_true", help="Copy data rows as plain values without formatting (faster on large sheets)")
+    parser.add_argument("--format", "-f", choices=OUTPUT_FORMATS, default="xlsx", help="Output format. parquet/feather write one file per code into a directory (default output: <input>_segregated/). Default: xlsx")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Worker processes used to write the output sheets. Default: 1")
 
     args = parser.parse_args()
 
@@ -264,6 +955,9 @@ def main() -> None:
         sheet=sheet_arg,
         column_spec=args.column,
         header_rows=args.header_rows,
+        values_only=args.values_only,
+        jobs=args.jobs,
+        output_format=args.format,
     )
     print(f"Created: {out}")
 
@@ -3,7 +3,6 @@ from __future__ import annotations
 
 from pathlib import Path
 from io import BytesIO
-import tempfile
 
 import streamlit as st
 from openpyxl import load_workbook
@@ -29,18 +28,43 @@ with st.sidebar:
         """
     )
 
+
+@st.cache_data(show_spinner=False)
+def load_sheetnames(data: bytes) -> list[str]:
+    """Sheet names of the uploaded workbook, parsed once per upload."""
+    wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def segregate_bytes(data: bytes, sheet: str | None, column_spec: str, header_rows: int, values_only: bool) -> bytes:
+    """Run segregate() in memory; reruns with the same upload and options reuse the result."""
+    out_bio = BytesIO()
+    segregate(
+        input_path=BytesIO(data),
+        output_path=out_bio,
+        sheet=sheet,
+        column_spec=column_spec,
+        header_rows=header_rows,
+        values_only=values_only,
+    )
+    return out_bio.getvalue()
+
+
 uploaded = st.file_uploader("Upload Excel file (.xlsx)", type=["xlsx", "xlsm"], accept_multiple_files=False)
 
 sheet_choice: str | None = None
 column_spec: str = "F"
 header_rows: int = 8
+values_only: bool = False
 
 if uploaded is not None:
     data = uploaded.read()
-    bio = BytesIO(data)
     try:
-        wb = load_workbook(bio, read_only=True, data_only=True)
-        sheetnames = wb.sheetnames
+        sheetnames = load_sheetnames(data)
     except Exception as e:
         st.error(f"Could not read workbook: {e}")
         st.stop()
@@ -52,30 +76,13 @@ if uploaded is not None:
         column_spec = st.text_input("Customer code column", value="F", help="Letter (e.g., F), 1-based index (e.g., 6), or header label.")
     with c3:
         header_rows = st.number_input("Header rows to preserve", min_value=0, max_value=100, value=8, step=1)
+    values_only = st.checkbox("Copy data rows as plain values (faster, drops data-row formatting)", value=False)
 
     st.divider()
     if st.button("Segregate", type="primary"):
         with st.spinner("Processing…"):
             try:
-                # Persist upload to a temp file so openpyxl can work with a filesystem path
-                with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp_in:
-                    tmp_in.write(data)
-                    tmp_in_path = Path(tmp_in.name)
-
-                # Create a temp output path for the result
-                tmp_out = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
-                tmp_out_path = Path(tmp_out.name)
-                tmp_out.close()
-
-                result = segregate(
-                    input_path=tmp_in_path,
-                    output_path=tmp_out_path,
-                    sheet=sheet_choice,
-                    column_spec=column_spec,
-                    header_rows=int(header_rows),
-                )
-
-                out_bytes = Path(result).read_bytes()
+                out_bytes = segregate_bytes(data, sheet_choice, column_spec, int(header_rows), values_only)
                 st.success("Segregation complete!")
                 st.download_button(
                     label="Download segregated workbook",
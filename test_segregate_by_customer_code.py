@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+import pytest
+import xlsxwriter
+from openpyxl import Workbook, load_workbook
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font, PatternFill
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.worksheet.formula import ArrayFormula
+
+from segregate_by_customer_code import segregate
+
+
+def make_workbook(path, rows, header=("Name", "Code", "Total")):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws.append(list(header))
+    for row in rows:
+        ws.append(list(row))
+    wb.save(path)
+    return path
+
+
+def test_array_formula_is_copied(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1), ("b", "C2", 2), ("c", "C1", 3)])
+    wb = load_workbook(src)
+    wb["Data"]["C4"] = ArrayFormula("C4", "=SUM(C2:C3*2)")
+    wb.save(src)
+
+    out = segregate(src, tmp_path / "out.xlsx", column_spec="B", header_rows=1)
+
+    ws = load_workbook(out)["C1"]
+    assert ws["C2"].value == 1
+    value = ws["C3"].value
+    assert isinstance(value, ArrayFormula)
+    assert value.ref == "C3"
+    assert value.text == "=SUM(C2:C3*2)"
+
+
+def test_values_only_reads_the_selected_worksheet(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1), ("b", "C2", 2)])
+    wb = load_workbook(src)
+    chart = BarChart()
+    chart.add_data(Reference(wb["Data"], min_col=3, min_row=1, max_row=3), titles_from_data=True)
+    wb.create_chartsheet("Chart", 0).add_chart(chart)
+    wb.save(src)
+
+    for sheet in (None, 0, -1, "Data"):
+        out = segregate(src, tmp_path / "out.xlsx", sheet=sheet, column_spec="B", header_rows=1, values_only=True)
+        assert load_workbook(out).sheetnames == ["C1", "C2"]
+
+
+def test_single_code_workbook_is_copied_and_renamed(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1), ("b", "C1", 2)])
+    wb = load_workbook(src)
+    validation = DataValidation(type="list", formula1='"x,y"')
+    validation.add("A2:A3")
+    wb["Data"].add_data_validation(validation)
+    wb.save(src)
+
+    out = segregate(src, tmp_path / "out.xlsx", column_spec="B", header_rows=1)
+
+    wb = load_workbook(out)
+    assert wb.sheetnames == ["C1"]
+    # Data validations are only kept when the file is copied
+    assert len(wb["C1"].data_validations.dataValidation) == 1
+
+
+def test_single_code_workbook_referring_to_its_sheet_is_rebuilt(tmp_path):
+    src = tmp_path / "in.xlsx"
+    wb = xlsxwriter.Workbook(str(src))
+    ws = wb.add_worksheet("Data")
+    for r, row in enumerate([("Name", "Code", "Total"), ("a", "C1", 1), ("b", "C1", 2)]):
+        ws.write_row(r, 0, row)
+    ws.data_validation("D2:D3", {"validate": "list", "source": "=Data!$A$2:$A$3"})
+    chart = wb.add_chart({"type": "column"})
+    chart.add_series({"values": "=Data!$C$2:$C$3"})
+    ws.insert_chart("F2", chart)
+    wb.close()
+
+    out = segregate(src, tmp_path / "out.xlsx", column_spec="B", header_rows=1)
+
+    with zipfile.ZipFile(out) as package:
+        assert not any(b"Data!" in package.read(name) for name in package.namelist())
+    assert load_workbook(out).sheetnames == ["C1"]
+
+
+def test_jobs_with_long_code_ending_in_underscore(tmp_path):
+    code = "ABCDEFGHIJKLMNOPQRSTUVWXYZABCD_"
+    src = make_workbook(tmp_path / "in.xlsx", [("a", code, 1), ("b", "C2", 2)])
+
+    out = segregate(src, tmp_path / "out.xlsx", column_spec="B", header_rows=1, jobs=2)
+
+    assert load_workbook(out).sheetnames == [code, "C2"]
+
+
+def test_jobs_output_matches_serial_output(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [(f"n{i}", f"C{i % 3}", i) for i in range(30)])
+    wb = load_workbook(src)
+    ws = wb["Data"]
+    ws.insert_rows(1)
+    ws["A1"] = "Report"
+    ws.merge_cells("A1:C1")
+    ws["A1"].font = Font(bold=True, size=14)
+    for r in range(3, ws.max_row + 1, 2):
+        ws.cell(r, 3).fill = PatternFill("solid", fgColor="FFFF00")
+        ws.cell(r, 1).number_format = "0.00"
+    wb.save(src)
+
+    serial = segregate(src, tmp_path / "serial.xlsx", column_spec="B", header_rows=2)
+    parallel = segregate(src, tmp_path / "parallel.xlsx", column_spec="B", header_rows=2, jobs=2)
+
+    # The parallel path splices worker sheets into a skeleton workbook and
+    # relies on every part sharing the same styles.xml.
+    with zipfile.ZipFile(serial) as a, zipfile.ZipFile(parallel) as b:
+        names = sorted(set(a.namelist()) - {"docProps/core.xml"})
+        assert names == sorted(set(b.namelist()) - {"docProps/core.xml"})
+        for name in names:
+            assert a.read(name) == b.read(name), name
+
+
+def test_column_index_zero_is_rejected(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1)])
+
+    with pytest.raises(ValueError, match="out of range"):
+        segregate(src, tmp_path / "out.xlsx", column_spec="0", header_rows=1)
+
+
+def test_columnar_file_names_keep_long_codes(tmp_path):
+    code = "A-very-long-customer-code-beyond-31-characters"
+    src = make_workbook(tmp_path / "in.xlsx", [("a", code, 1), ("b", "C/2", 2)])
+
+    out = segregate(src, tmp_path / "out", column_spec="B", header_rows=1, output_format="parquet")
+
+    assert sorted(p.name for p in out.iterdir()) == [f"{code}.parquet", "C_2.parquet"]
+
+
+@pytest.mark.parametrize("code", ["C1", "Data"])
+def test_single_code_workbook_written_over_itself(tmp_path, code):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", code, 1), ("b", code, 2)])
+
+    out = segregate(src, src, column_spec="B", header_rows=1)
+
+    ws = load_workbook(out)[code]
+    assert [[c.value for c in row] for row in ws.iter_rows()] == [["Name", "Code", "Total"], ["a", code, 1], ["b", code, 2]]
+
+
+def test_columnar_output_columns_and_values(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1), ("b", "C2", 2.5), ("c", "C1", 3)], header=("B", None, "Total"))
+    wb = load_workbook(src)
+    # Formatting-only header cell past the data columns
+    wb["Data"]["H1"].fill = PatternFill("solid", fgColor="FFFF00")
+    wb.save(src)
+
+    out = segregate(src, tmp_path / "out", column_spec="B", header_rows=1, output_format="parquet")
+
+    df = pd.read_parquet(out / "C1.parquet")
+    assert list(df.columns) == ["B", "B_1", "Total"]
+    assert df.to_dict("list") == {"B": ["a", "c"], "B_1": ["C1", "C1"], "Total": [1, 3]}
+    df = pd.read_parquet(out / "C2.parquet")
+    assert df.to_dict("list") == {"B": ["b"], "B_1": ["C2"], "Total": [2.5]}
+
+
+def read_rows(data, sheet):
+    ws = load_workbook(BytesIO(data))[sheet]
+    return [[c.value for c in row] for row in ws.iter_rows()]
+
+
+@pytest.mark.parametrize("codes", [("C1", "C2", "C1"), ("C1", "C1", "C1")])
+def test_file_objects_round_trip(tmp_path, codes):
+    rows = [(f"n{i}", code, i) for i, code in enumerate(codes)]
+    src = make_workbook(tmp_path / "in.xlsx", rows)
+    out = BytesIO()
+
+    result = segregate(BytesIO(src.read_bytes()), out, column_spec="B", header_rows=1)
+
+    assert result is out
+    expected = segregate(src, tmp_path / "out.xlsx", column_spec="B", header_rows=1)
+    assert load_workbook(BytesIO(out.getvalue())).sheetnames == load_workbook(expected).sheetnames
+    for code in sorted(set(codes)):
+        assert read_rows(out.getvalue(), code) == [["Name", "Code", "Total"]] + [list(r) for r in rows if r[1] == code]
+
+
+def test_file_object_input_needs_output_path(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1)])
+
+    with pytest.raises(ValueError, match="output path is required"):
+        segregate(BytesIO(src.read_bytes()), column_spec="B", header_rows=1)
+
+
+def test_macro_enabled_workbook_is_not_copied_to_file_object(tmp_path):
+    src = make_workbook(tmp_path / "in.xlsx", [("a", "C1", 1), ("b", "C1", 2)])
+    macro = BytesIO()
+    with zipfile.ZipFile(src) as package, zipfile.ZipFile(macro, "w") as out:
+        for info in package.infolist():
+            data = package.read(info)
+            if info.filename == "[Content_Types].xml":
+                data = data.replace(
+                    b"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+                    b"application/vnd.ms-excel.sheet.macroEnabled.main+xml",
+                )
+                assert b"macroEnabled" in data
+            out.writestr(info, data)
+    out = BytesIO()
+
+    segregate(BytesIO(macro.getvalue()), out, column_spec="B", header_rows=1)
+
+    with zipfile.ZipFile(out) as package:
+        assert b"macroEnabled" not in package.read("[Content_Types].xml")
+    assert read_rows(out.getvalue(), "C1") == [["Name", "Code", "Total"], ["a", "C1", 1], ["b", "C1", 2]]